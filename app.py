@@ -5,8 +5,9 @@ Ask questions in plain English and get SQL results + semantic search
 
 import streamlit as st
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.pool
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import re
 import pandas as pd
@@ -16,53 +17,100 @@ from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 import faiss
 import numpy as np
-import pickle
+import json
+import sqlparse
 
 
 load_dotenv()
 
 gemini_client = genai.Client(api_key=os.getenv('GOOGLE_API_KEY'))
 
+@st.cache_data(max_entries=1024, show_spinner=False)
 def get_embedding(text):
-    """Convert text to vector using Gemini"""
+    """Convert text to vector using Gemini (repeat questions hit the cache)"""
     result = gemini_client.models.embed_content(
         model="text-embedding-004",
         contents=text
     )
     return np.array(result.embeddings[0].values, dtype='float32')
 
+@st.cache_resource(show_spinner=False)
+def load_index(table_name):
+    """Load FAISS index and metadata once, keep them cached across reruns"""
+    try:
+        # mmap lets the OS page the index in on first access and share the
+        # pages across Streamlit workers instead of copying it onto the heap
+        index = faiss.read_index(f"faiss_indexes/{table_name}.index",
+                                 faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except Exception:
+        # Not every index type supports mmap reads; fall back to a full load
+        index = faiss.read_index(f"faiss_indexes/{table_name}.index")
+    try:
+        bin_index = faiss.read_index_binary(f"faiss_indexes/{table_name}.bindex")
+        # Stored as FP16 on disk; upcast once here for exact rescoring
+        vectors = np.load(f"faiss_indexes/{table_name}_vectors.npy").astype('float32')
+    except Exception:
+        bin_index, vectors = None, None
+    ids = np.load(f"faiss_indexes/{table_name}_ids.npy")
+    with open(f"faiss_indexes/{table_name}_texts.json") as f:
+        # object array so result rows can be gathered by fancy indexing
+        texts = np.array(json.load(f), dtype=object)
+    return index, bin_index, vectors, ids, texts
+
 def search_similar(table_name, query_text, top_k=5):
     """
     Search for similar items using FAISS
     Returns: List of {id, text, similarity} dictionaries
     """
     try:
-        index = faiss.read_index(f"faiss_indexes/{table_name}.index")
-        with open(f"faiss_indexes/{table_name}_metadata.pkl", 'rb') as f:
-            metadata = pickle.load(f)
-        
-        query_vector = get_embedding(query_text).reshape(1, -1)
-        faiss.normalize_L2(query_vector)
-        
-        similarities, indices = index.search(query_vector, top_k)
-        
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(metadata['ids']):
-                results.append({
-                    'id': metadata['ids'][idx],
-                    'text': metadata['texts'][idx],
-                    'similarity': float(similarities[0][i])
-                })
+        index, bin_index, vectors, ids, texts = load_index(table_name)
+
+        # Corpus vectors were normalized once at index build time, so only
+        # the query needs normalizing; a single divide beats normalize_L2's
+        # per-row copy path for n=1
+        query_vector = get_embedding(query_text)
+        norm = np.linalg.norm(query_vector)
+        if norm > 0:
+            query_vector /= norm
+        query_vector = query_vector.reshape(1, -1)
+
+        if bin_index is not None:
+            # Stage 1: Hamming-distance shortlist over packed sign bits
+            query_bits = np.packbits((query_vector > 0).astype('uint8'), axis=1)
+            shortlist = min(top_k * 8, bin_index.ntotal)
+            _, candidates = bin_index.search(query_bits, shortlist)
+            candidates = candidates[0]
+            candidates = candidates[candidates >= 0]
+
+            # Stage 2: exact FP32 inner products on the shortlist only
+            scores = vectors[candidates] @ query_vector[0]
+            order = np.argsort(scores)[::-1][:top_k]
+            indices = candidates[order].reshape(1, -1)
+            similarities = scores[order].reshape(1, -1)
+        else:
+            if isinstance(index, faiss.IndexHNSWFlat):
+                index.hnsw.efSearch = max(top_k * 4, 32)
+
+            similarities, indices = index.search(query_vector, top_k)
         
-        return results
+        # Gather valid hits with vectorized indexing instead of a per-element loop
+        mask = (indices[0] >= 0) & (indices[0] < len(ids))
+        valid_idx = indices[0][mask]
+
+        return [
+            {'id': int(row_id), 'text': text, 'similarity': float(sim)}
+            for row_id, text, sim in zip(ids[valid_idx], texts[valid_idx],
+                                         similarities[0][mask])
+        ]
     except:
         return []
 
 
-def get_db_connection():
-    """Connect to PostgreSQL"""
-    return psycopg2.connect(
+@st.cache_resource(show_spinner=False)
+def get_db_pool():
+    """Shared PostgreSQL connection pool (reuses sockets across reruns)"""
+    return psycopg2.pool.ThreadedConnectionPool(
+        1, 8,
         host=os.getenv('DB_HOST', 'localhost'),
         port=os.getenv('DB_PORT', '5432'),
         database=os.getenv('DB_NAME', 'vosco'),
@@ -70,35 +118,46 @@ def get_db_connection():
         password=os.getenv('DB_PASSWORD')
     )
 
+def _rows_to_dicts(cursor):
+    """Build one dict per fetched row from the cursor's column names"""
+    cols = [d[0] for d in cursor.description]
+    return [dict(zip(cols, row)) for row in cursor.fetchall()]
+
 def run_query(sql):
     """Execute SQL query and return results"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute(sql)
-    results = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return [dict(row) for row in results]
+    db_pool = get_db_pool()
+    conn = db_pool.getconn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql)
+        results = _rows_to_dicts(cursor)
+        cursor.close()
+        return results
+    finally:
+        db_pool.putconn(conn)
 
 def get_full_records(table_name, ids):
     if not ids:
         return []
-    
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    if table_name == 'employees':
-        cursor.execute("SELECT id, name, email, salary FROM employees WHERE id = ANY(%s)", (ids,))
-    elif table_name == 'departments':
-        cursor.execute("SELECT id, name FROM departments WHERE id = ANY(%s)", (ids,))
-    elif table_name == 'products':
-        cursor.execute("SELECT id, name, price FROM products WHERE id = ANY(%s)", (ids,))
-    elif table_name == 'orders':
-        cursor.execute("SELECT id, customer_name, order_total, order_date FROM orders WHERE id = ANY(%s)", (ids,))
-    
-    results = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return [dict(row) for row in results]
+
+    db_pool = get_db_pool()
+    conn = db_pool.getconn()
+    try:
+        cursor = conn.cursor()
+        if table_name == 'employees':
+            cursor.execute("SELECT id, name, email, salary FROM employees WHERE id = ANY(%s)", (ids,))
+        elif table_name == 'departments':
+            cursor.execute("SELECT id, name FROM departments WHERE id = ANY(%s)", (ids,))
+        elif table_name == 'products':
+            cursor.execute("SELECT id, name, price FROM products WHERE id = ANY(%s)", (ids,))
+        elif table_name == 'orders':
+            cursor.execute("SELECT id, customer_name, order_total, order_date FROM orders WHERE id = ANY(%s)", (ids,))
+
+        results = _rows_to_dicts(cursor)
+        cursor.close()
+        return results
+    finally:
+        db_pool.putconn(conn)
 
 def initialize_llm():
     """Setup Google Gemini"""
@@ -108,23 +167,21 @@ def initialize_llm():
         temperature=0.1
     )
 
-def create_sql_from_question(question, llm):
-    """Convert natural language to SQL using Gemini"""
-    schema = """
+_SCHEMA = """
     TABLES:
     - departments (id, name)
     - employees (id, name, department_id, email, salary)
     - products (id, name, price)
     - orders (id, customer_name, employee_id, order_total, order_date)
-    
+
     RELATIONSHIPS:
     - employees.department_id → departments.id
     - orders.employee_id → employees.id
     """
-    
-    prompt = PromptTemplate(
-        input_variables=["schema", "question"],
-        template="""You are a SQL expert. Convert this question to PostgreSQL SQL.
+
+_SQL_PROMPT = PromptTemplate(
+    input_variables=["schema", "question"],
+    template="""You are a SQL expert. Convert this question to PostgreSQL SQL.
 
 DATABASE:
 {schema}
@@ -138,32 +195,43 @@ RULES:
 QUESTION: {question}
 
 SQL:"""
-    )
-    
-    # Create chain and run
-    chain = prompt | llm | StrOutputParser()
-    response = chain.invoke({"schema": schema, "question": question})
-    
+)
+
+# Precompiled markdown-fence strippers (no per-call pattern compilation)
+_SQL_FENCE_RE = re.compile(r'```sql\n?')
+_FENCE_RE = re.compile(r'```\n?')
+
+@st.cache_resource
+def get_sql_chain():
+    """Compose prompt | llm | parser once and reuse it across reruns"""
+    return _SQL_PROMPT | initialize_llm() | StrOutputParser()
+
+def create_sql_from_question(question):
+    """Convert natural language to SQL using Gemini"""
+    response = get_sql_chain().invoke({"schema": _SCHEMA, "question": question})
+
     # Clean up the response
     sql = response.strip()
-    sql = re.sub(r'```sql\n?', '', sql)  # Remove markdown
-    sql = re.sub(r'```\n?', '', sql)
+    sql = _SQL_FENCE_RE.sub('', sql)  # Remove markdown
+    sql = _FENCE_RE.sub('', sql)
     return sql.strip()
 
 def is_safe_sql(sql):
-    """Check if SQL is safe (prevent injection)"""
-    sql_upper = sql.strip().upper()
-    sql_upper = re.sub(r'--.*$', '', sql_upper, flags=re.MULTILINE)
-    
-    dangerous = ['DROP', 'DELETE', 'INSERT', 'UPDATE', 'ALTER', 'CREATE', 'TRUNCATE', 'EXEC']
-    
-    for keyword in dangerous:
-        if keyword in sql_upper:
-            return False, f"Blocked keyword: {keyword}"
-    
-    if not sql_upper.startswith('SELECT'):
+    """Check if SQL is safe (single SELECT statement, no DDL/DML)"""
+    statements = [s for s in sqlparse.parse(sql) if str(s).strip()]
+
+    if len(statements) != 1:
+        return False, "Only a single statement is allowed"
+
+    statement = statements[0]
+    if statement.get_type() != 'SELECT':
         return False, "Only SELECT queries allowed"
-    
+
+    for token in statement.flatten():
+        if token.ttype in (sqlparse.tokens.DDL, sqlparse.tokens.DML) \
+                and token.normalized != 'SELECT':
+            return False, f"Blocked keyword: {token.normalized}"
+
     return True, "OK"
 
 st.set_page_config(page_title="Natural Language Database Search", page_icon="🔍", layout="wide")
@@ -177,8 +245,9 @@ with st.sidebar:
     
     if st.button("🔌 Test Connection"):
         try:
-            conn = get_db_connection()
-            conn.close()
+            db_pool = get_db_pool()
+            conn = db_pool.getconn()
+            db_pool.putconn(conn)
             st.success("✓ Connected to database!")
         except Exception as e:
             st.error(f"✗ Connection failed: {e}")
@@ -196,8 +265,6 @@ with st.sidebar:
 
 st.markdown("---")
 
-llm = initialize_llm()
-
 col1, col2 = st.columns([4, 1])
 
 with col1:
@@ -213,7 +280,7 @@ with col2:
 if search_btn and user_question:
     try:
         st.info("🤖 Generating SQL with Gemini...")
-        sql = create_sql_from_question(user_question, llm)
+        sql = create_sql_from_question(user_question)
         st.code(sql, language='sql')
         
         safe, message = is_safe_sql(sql)
@@ -222,8 +289,29 @@ if search_btn and user_question:
             st.stop()
         
         st.info("⚡ Running query...")
-        sql_results = run_query(sql)
-        
+        question_lower = user_question.lower()
+
+        if 'employee' in question_lower or 'staff' in question_lower:
+            similar_table, similar_top_k = 'employees', 5
+        elif 'department' in question_lower:
+            similar_table, similar_top_k = 'departments', 3
+        elif 'product' in question_lower:
+            similar_table, similar_top_k = 'products', 5
+        else:
+            similar_table = None
+
+        # Postgres and FAISS+Gemini are independent systems; overlap the
+        # SQL round-trip with the semantic search instead of serializing them
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            fut_sql = executor.submit(run_query, sql)
+            fut_similar = None
+            if similar_table:
+                fut_similar = executor.submit(
+                    search_similar, similar_table, user_question, similar_top_k
+                )
+            sql_results = fut_sql.result()
+            similar = fut_similar.result() if fut_similar else []
+
         st.success(f"✅ Found {len(sql_results)} results")
         
         if len(sql_results) > 0:
@@ -242,35 +330,30 @@ if search_btn and user_question:
             st.info("No results found")
         
         st.info("🔍 Finding similar items...")
-        question_lower = user_question.lower()
-        
-        if 'employee' in question_lower or 'staff' in question_lower:
-            similar = search_similar('employees', user_question, top_k=5)
-            if similar:
-                st.subheader("🎯 Similar Employees (Semantic Search)")
-                for item in similar[:3]:
-                    records = get_full_records('employees', [item['id']])
-                    if records:
-                        rec = records[0]
-                        st.write(f"**{rec['name']}** ({item['similarity']*100:.0f}% match)")
-                        st.caption(f"Email: {rec['email']} | Salary: ${rec['salary']:,.2f}")
-        
-        elif 'department' in question_lower:
-            similar = search_similar('departments', user_question, top_k=3)
-            if similar:
-                st.subheader("🎯 Similar Departments")
-                for item in similar:
-                    st.write(f"• {item['text']} ({item['similarity']*100:.0f}% match)")
-        
-        elif 'product' in question_lower:
-            similar = search_similar('products', user_question, top_k=5)
-            if similar:
-                st.subheader("🎯 Similar Products")
-                for item in similar[:3]:
-                    records = get_full_records('products', [item['id']])
-                    if records:
-                        rec = records[0]
-                        st.write(f"**{rec['name']}** - ${rec['price']} ({item['similarity']*100:.0f}% match)")
+
+        if similar_table == 'employees' and similar:
+            st.subheader("🎯 Similar Employees (Semantic Search)")
+            records = get_full_records('employees', [item['id'] for item in similar])
+            records_by_id = {rec['id']: rec for rec in records}
+            for item in similar[:3]:
+                rec = records_by_id.get(item['id'])
+                if rec:
+                    st.write(f"**{rec['name']}** ({item['similarity']*100:.0f}% match)")
+                    st.caption(f"Email: {rec['email']} | Salary: ${rec['salary']:,.2f}")
+
+        elif similar_table == 'departments' and similar:
+            st.subheader("🎯 Similar Departments")
+            for item in similar:
+                st.write(f"• {item['text']} ({item['similarity']*100:.0f}% match)")
+
+        elif similar_table == 'products' and similar:
+            st.subheader("🎯 Similar Products")
+            records = get_full_records('products', [item['id'] for item in similar])
+            records_by_id = {rec['id']: rec for rec in records}
+            for item in similar[:3]:
+                rec = records_by_id.get(item['id'])
+                if rec:
+                    st.write(f"**{rec['name']}** - ${rec['price']} ({item['similarity']*100:.0f}% match)")
         
     except Exception as e:
         st.error(f"❌ Error: {str(e)}")
@@ -6,12 +6,15 @@ This script does two things:
 """
 
 import psycopg2
+from psycopg2.extras import execute_values
 import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from datetime import date, timedelta
 import faiss
 import numpy as np
-import pickle
+import json
 from google import genai
 
 # Load environment settings
@@ -24,57 +27,131 @@ client = genai.Client(api_key=os.getenv('GOOGLE_API_KEY'))
 # EMBEDDING FUNCTIONS
 # ==============================================================================
 
-def get_embedding(text):
-    """
-    Convert text to a vector using Google Gemini
-    Returns: 768-dimensional numpy array
-    """
+def _embed_batch(batch):
+    """Embed one batch of texts with a single API call"""
     result = client.models.embed_content(
         model="text-embedding-004",
-        contents=text
+        contents=batch
     )
-    return np.array(result.embeddings[0].values, dtype='float32')
+    return [np.asarray(emb.values, dtype='float32') for emb in result.embeddings]
+
+def get_embeddings_batch(texts, batch_size=100, max_workers=8):
+    """
+    Convert many texts to vectors, one API call per batch of 100,
+    with batches issued concurrently so the network round-trips overlap
+    Returns: (len(texts), 768) numpy array
+    """
+    batches = [texts[start:start + batch_size]
+               for start in range(0, len(texts), batch_size)]
+
+    embeddings = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch_embeddings in executor.map(_embed_batch, batches):
+            embeddings.extend(batch_embeddings)
+    return np.stack(embeddings)
+
+def _content_hash(row_id, text):
+    """Stable fingerprint of an embedded row, used to skip unchanged items"""
+    return hashlib.sha256(f"{row_id}\t{text}".encode()).hexdigest()
 
 def create_faiss_index(table_name, texts, ids):
     """
-    Create FAISS index for fast similarity search
-    
+    Create (or incrementally extend) the FAISS index for a table
+
     Args:
         table_name: Name of the table (e.g., 'employees')
         texts: List of text strings to embed
         ids: List of corresponding database IDs
+
+    Rows already in the index (matched by id + text content) are skipped,
+    so reruns of this script only embed new or changed rows.
     """
     if len(texts) == 0:
         return
-    
+
+    os.makedirs("faiss_indexes", exist_ok=True)
+    index_path = f"faiss_indexes/{table_name}.index"
+    ids_path = f"faiss_indexes/{table_name}_ids.npy"
+    known_ids = []
+    known_texts = []
+
+    # Go incremental only when the current-format sidecars are present;
+    # an old-format directory (e.g. pickled metadata) gets a fresh build
+    if os.path.exists(index_path) and os.path.exists(ids_path):
+        known_ids = np.load(ids_path).tolist()
+        with open(f"faiss_indexes/{table_name}_texts.json") as f:
+            known_texts = json.load(f)
+
+        known_hashes = {_content_hash(i, t) for i, t in zip(known_ids, known_texts)}
+        new_items = [(i, t) for i, t in zip(ids, texts)
+                     if _content_hash(i, t) not in known_hashes]
+        if not new_items:
+            print(f"  ✓ {table_name} index already up to date, skipping")
+            return
+        ids = [i for i, _ in new_items]
+        texts = [t for _, t in new_items]
+
     print(f"  Creating embeddings for {table_name}...")
-    
-    # Generate embeddings for all texts
-    embeddings = []
-    for text in texts:
-        emb = get_embedding(text)
-        embeddings.append(emb)
-    
-    embeddings_array = np.array(embeddings, dtype='float32')
-    
+
+    # Generate embeddings for all new texts in one batched API call
+    embeddings_array = get_embeddings_batch(texts)
+
     # Normalize vectors for cosine similarity
     faiss.normalize_L2(embeddings_array)
-    
-    # Create FAISS index using Inner Product (cosine similarity)
+
     dimension = 768  # Gemini embedding size
-    index = faiss.IndexFlatIP(dimension)
-    index.add(embeddings_array)
-    
+    bin_codes = np.packbits((embeddings_array > 0).astype('uint8'), axis=1)
+
+    if known_ids:
+        # Incremental path: append to the existing index and sidecars
+        # (no retraining needed, every index type here supports streaming add)
+        index = faiss.read_index(index_path)
+        index.add(embeddings_array)
+        bin_index = faiss.read_index_binary(f"faiss_indexes/{table_name}.bindex")
+        bin_index.add(bin_codes)
+        vectors_fp16 = np.concatenate([
+            np.load(f"faiss_indexes/{table_name}_vectors.npy"),
+            embeddings_array.astype(np.float16)
+        ])
+    else:
+        # Fresh build using Inner Product (cosine similarity)
+        if len(texts) > 1000:
+            # Large table: approximate HNSW search instead of a full scan
+            index = faiss.IndexHNSWFlat(dimension, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 200
+            index.add(embeddings_array)
+        else:
+            # Small table: exact search over int8-quantized vectors.
+            # 4x smaller than FP32 and 4x less memory bandwidth per search,
+            # with negligible recall loss at this scale
+            index = faiss.IndexScalarQuantizer(
+                dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
+            index.train(embeddings_array)
+            index.add(embeddings_array)
+
+        # Binary sign-bit index: Hamming-distance prefilter (one XOR+popcount
+        # per vector), with the vectors kept to rescore the shortlist exactly
+        bin_index = faiss.IndexBinaryFlat(dimension)
+        bin_index.add(bin_codes)
+        # FP16 on disk halves the bytes stored and read; upcast again on load
+        vectors_fp16 = embeddings_array.astype(np.float16)
+
+    all_ids = known_ids + list(ids)
+    all_texts = known_texts + list(texts)
+
     # Save index to disk
-    os.makedirs("faiss_indexes", exist_ok=True)
-    faiss.write_index(index, f"faiss_indexes/{table_name}.index")
-    
-    # Save metadata (IDs and texts)
-    metadata = {'ids': ids, 'texts': texts}
-    with open(f"faiss_indexes/{table_name}_metadata.pkl", 'wb') as f:
-        pickle.dump(metadata, f)
-    
-    print(f"  ✓ Saved {len(texts)} embeddings for {table_name}")
+    faiss.write_index(index, index_path)
+    faiss.write_index_binary(bin_index, f"faiss_indexes/{table_name}.bindex")
+    np.save(f"faiss_indexes/{table_name}_vectors.npy", vectors_fp16)
+
+    # Save metadata: ids as a NumPy array (fast, mmap-able load),
+    # texts as plain JSON instead of pickled Python lists
+    np.save(ids_path, np.asarray(all_ids, dtype=np.int64))
+    with open(f"faiss_indexes/{table_name}_texts.json", 'w') as f:
+        json.dump(all_texts, f)
+
+    print(f"  ✓ Saved {len(texts)} new embeddings for {table_name}")
 
 # ==============================================================================
 # DATABASE INSERTION
@@ -105,22 +182,18 @@ def insert_sample_data():
         "Finance"
     ]
     
-    dept_ids = {}
-    dept_names = []
-    dept_id_list = []
-    
-    for dept in departments:
-        cursor.execute("""
-            INSERT INTO departments (name) 
-            VALUES (%s) 
-            ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
-            RETURNING id
-        """, (dept,))
-        dept_id = cursor.fetchone()[0]
-        dept_ids[dept] = dept_id
-        dept_names.append(dept)
-        dept_id_list.append(dept_id)
-    
+    # One round-trip for all departments instead of one per row
+    dept_rows = execute_values(cursor, """
+        INSERT INTO departments (name)
+        VALUES %s
+        ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+        RETURNING id, name
+    """, [(dept,) for dept in departments], fetch=True)
+
+    dept_ids = {name: dept_id for dept_id, name in dept_rows}
+    dept_names = [name for _, name in dept_rows]
+    dept_id_list = [dept_id for dept_id, _ in dept_rows]
+
     print(f"✓ Inserted {len(departments)} departments")
     create_faiss_index('departments', dept_names, dept_id_list)
     
@@ -139,22 +212,18 @@ def insert_sample_data():
         ("Maria Garcia", "Sales", "maria.g@company.com", 76000.00),
     ]
     
-    emp_ids = {}
-    emp_names = []
-    emp_id_list = []
-    
-    for name, dept, email, salary in employees_data:
-        cursor.execute("""
-            INSERT INTO employees (name, department_id, email, salary) 
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (email) DO UPDATE SET name = EXCLUDED.name
-            RETURNING id
-        """, (name, dept_ids[dept], email, salary))
-        emp_id = cursor.fetchone()[0]
-        emp_ids[name] = emp_id
-        emp_names.append(name)
-        emp_id_list.append(emp_id)
-    
+    emp_rows = execute_values(cursor, """
+        INSERT INTO employees (name, department_id, email, salary)
+        VALUES %s
+        ON CONFLICT (email) DO UPDATE SET name = EXCLUDED.name
+        RETURNING id, name
+    """, [(name, dept_ids[dept], email, salary)
+          for name, dept, email, salary in employees_data], fetch=True)
+
+    emp_ids = {name: emp_id for emp_id, name in emp_rows}
+    emp_names = [name for _, name in emp_rows]
+    emp_id_list = [emp_id for emp_id, _ in emp_rows]
+
     print(f"✓ Inserted {len(employees_data)} employees")
     create_faiss_index('employees', emp_names, emp_id_list)
     
@@ -173,19 +242,15 @@ def insert_sample_data():
         ("Noise Cancelling Headphones", 249.99),
     ]
     
-    product_names = []
-    product_ids = []
-    
-    for name, price in products_data:
-        cursor.execute("""
-            INSERT INTO products (name, price) 
-            VALUES (%s, %s)
-            RETURNING id
-        """, (name, price))
-        prod_id = cursor.fetchone()[0]
-        product_names.append(name)
-        product_ids.append(prod_id)
-    
+    product_rows = execute_values(cursor, """
+        INSERT INTO products (name, price)
+        VALUES %s
+        RETURNING id, name
+    """, products_data, fetch=True)
+
+    product_ids = [prod_id for prod_id, _ in product_rows]
+    product_names = [name for _, name in product_rows]
+
     print(f"✓ Inserted {len(products_data)} products")
     create_faiss_index('products', product_names, product_ids)
     
@@ -205,24 +270,24 @@ def insert_sample_data():
     ]
     
     base_date = date.today() - timedelta(days=90)
-    customer_names = []
-    order_ids = []
-    
+    orders_data = []
+
     for i in range(20):
         customer = customers[i % len(customers)]
         employee_name = list(emp_ids.keys())[i % len(emp_ids)]
         order_total = round(100 + (i * 50.5), 2)
         order_date = base_date + timedelta(days=i*4)
-        
-        cursor.execute("""
-            INSERT INTO orders (customer_name, employee_id, order_total, order_date) 
-            VALUES (%s, %s, %s, %s)
-            RETURNING id
-        """, (customer, emp_ids[employee_name], order_total, order_date))
-        order_id = cursor.fetchone()[0]
-        customer_names.append(customer)
-        order_ids.append(order_id)
-    
+        orders_data.append((customer, emp_ids[employee_name], order_total, order_date))
+
+    order_rows = execute_values(cursor, """
+        INSERT INTO orders (customer_name, employee_id, order_total, order_date)
+        VALUES %s
+        RETURNING id, customer_name
+    """, orders_data, fetch=True)
+
+    order_ids = [order_id for order_id, _ in order_rows]
+    customer_names = [customer for _, customer in order_rows]
+
     print(f"✓ Inserted 20 orders")
     create_faiss_index('orders', customer_names, order_ids)
     